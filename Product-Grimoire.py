@@ -19,7 +19,7 @@ Para cada produto na sua planilha, o script vai:
 
 1.  **Instale as dependências:**
     ```bash
-    pip install pandas requests beautifulsoup4 google-api-python-client google-generativeai openpyxl tqdm
+    pip install pandas requests lxml google-api-python-client google-generativeai openpyxl tqdm
     ```
 
 2.  **Insira suas Chaves de API no Código:**
@@ -28,12 +28,32 @@ Para cada produto na sua planilha, o script vai:
 
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import lxml.html
 import time
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import google.generativeai as genai
 import os
+import csv
+import openpyxl
+import json
+from itertools import islice
+from collections import deque
+from functools import lru_cache
+import shutil
+import re
+import html
+import shelve
+import hashlib
 from urllib.parse import urlparse, urljoin
 from tqdm import tqdm # Importa a biblioteca para a barra de progresso
 
@@ -55,93 +75,344 @@ GEMINI_API_KEY = "COLE_SUA_CHAVE_DA_API_GEMINI_AQUI"
 # Arquivos de saída
 IMAGE_FOLDER = 'imagens_produtos'
 OUTPUT_FILENAME = 'produtos_formatados.xlsx'
+# Progresso salvo linha a linha; se o script parar no meio, a próxima execução continua daqui
+PARTIAL_FILENAME = 'produtos_formatados.partial.csv'
+OUTPUT_COLUMNS = [
+    "Nome", "Descrição Curta", "Descrição Longa (HTML)", "Preço", "Referência / SKU", "Peso",
+    "Estoque", "URL da Imagem", "Situação", "Caminho Imagem Local", "URL Origem Página",
+]
+# Valor gravado quando a busca no Google falha (quota, instabilidade...) e não apenas não acha nada
+SEARCH_ERROR = "Erro na busca"
+# Linhas com algum destes valores não são salvas no progresso, para serem refeitas na próxima execução
+ERROR_VALUES = {SEARCH_ERROR, "Erro ao baixar imagem", "Erro ao gerar descrição", "Erro ao extrair descrição curta"}
+# Log detalhado de cada produto (no terminal aparecem só avisos e erros)
+LOG_FILENAME = 'grimoire.log'
+# Cache em disco das buscas no Google e das imagens extraídas das páginas (evita gastar quota ao rodar de novo)
+CACHE_FILENAME = '.cse_cache.db'
+
+# Conexões HTTP (páginas de produto e download de imagens)
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+HTTP_POOL_SIZE = 32
+# Quantos bytes do início da página são lidos primeiro: a meta tag og:image sempre fica no <head>
+PAGE_HEAD_BYTES = 256 * 1024
+# Tamanho dos blocos copiados da rede para o disco ao baixar imagens
+IMAGE_CHUNK_BYTES = 1 << 20
+
+# Paralelismo: quantos produtos são processados ao mesmo tempo
+MAX_WORKERS = 8
+# Processos dedicados a montar a árvore HTML (trabalho de CPU, que threads não paralelizam por causa do GIL)
+PARSE_WORKERS = os.cpu_count() or 1
+# Quantos produtos vão em cada pedido de descrições para o Gemini
+AI_BATCH_SIZE = 8
+# Quantos lotes ficam em andamento ao mesmo tempo (o restante só é enviado conforme os primeiros terminam)
+BATCHES_IN_FLIGHT = 3
+
+# Controle de ritmo das APIs (em segundos): o intervalo diminui aos poucos quando tudo vai bem
+# e dobra a cada erro de quota (429) ou instabilidade (5xx)
+RATE_INITIAL_DELAY = 0.2
+RATE_MIN_DELAY = 0.05
+RATE_MAX_DELAY = 30.0
+# Quantas vezes uma busca no Google é repetida após um erro de quota (429) ou instabilidade (5xx),
+# e o tempo máximo (em segundos) que uma busca pode passar tentando de novo
+CSE_MAX_RETRIES = 3
+CSE_MAX_RETRY_SECONDS = 60
+# Depois de tantas respostas 429 seguidas (ex.: limite diário esgotado), as buscas são desligadas até o fim
+CSE_QUOTA_FAILURES_TO_STOP = 5
+
+# Meta tag og:image nas duas ordens de atributos possíveis (property antes ou depois do content)
+_OG_RE = re.compile(rb'<meta[^>]+property=["\']og:image["\'][^>]+content=["\']([^"\']+)', re.I)
+_OG_RE2 = re.compile(rb'<meta[^>]+content=["\']([^"\']+)["\'][^>]+property=["\']og:image["\']', re.I)
+# Imagens que quase nunca são a foto do produto (logos, ícones, carregadores...) e imagens que costumam ser as maiores
+_BLACKLIST_RE = re.compile(r'logo|icon|avatar|spinner|\.svg|\.gif|base64', re.I)
+_ZOOM_RE = re.compile(r'zoom|large', re.I)
+# Separa as duas seções da resposta do Gemini (descrição curta e longa) em uma única busca
+_DESC_RE = re.compile(r'\[DESCRIÇÃO CURTA\](.*?)\[DESCRIÇÃO LONGA HTML\](.*)', re.DOTALL)
 
 # --- FUNÇÕES ---
 
+logger = logging.getLogger('grimoire')
+
+class TqdmHandler(logging.Handler):
+    """Mostra as mensagens no terminal sem quebrar a barra de progresso do tqdm."""
+
+    def emit(self, record):
+        try:
+            tqdm.write(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+def setup_logging():
+    """
+    As threads só colocam as mensagens em uma fila; uma única thread (o listener) grava tudo em
+    LOG_FILENAME e mostra no terminal apenas avisos e erros. Retorna o listener, que deve ser parado no fim.
+    """
+    file_handler = logging.FileHandler(LOG_FILENAME, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(threadName)s] %(message)s'))
+    terminal_handler = TqdmHandler(level=logging.WARNING)
+    terminal_handler.setFormatter(logging.Formatter('  -> %(message)s'))
+
+    log_queue = queue.Queue()
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, file_handler, terminal_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+class RateController:
+    """
+    Controla o intervalo entre chamadas a uma API, compartilhado entre todas as threads (AIMD).
+    Cada sucesso reduz o intervalo multiplicando por `alpha`; cada erro o multiplica por `beta`,
+    respeitando o `Retry-After` informado pelo servidor.
+    """
+
+    def __init__(self, delay=RATE_INITIAL_DELAY, min_delay=RATE_MIN_DELAY, max_delay=RATE_MAX_DELAY, alpha=0.9, beta=2.0):
+        self.delay = delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.alpha = alpha
+        self.beta = beta
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        """Bloqueia até a vez desta chamada, reservando o próximo horário livre."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.delay
+        if slot > now:
+            time.sleep(slot - now)
+
+    def on_success(self):
+        with self._lock:
+            self.delay = max(self.min_delay, self.delay * self.alpha)
+
+    def on_error(self, retry_after=None):
+        with self._lock:
+            self.delay = min(self.max_delay, self.delay * self.beta)
+            if retry_after:
+                self.delay = min(self.max_delay, max(self.delay, retry_after))
+                self._next_slot = max(self._next_slot, time.monotonic() + retry_after)
+
+class CircuitBreaker:
+    """Desliga uma API depois de `threshold` erros de quota seguidos; um sucesso zera a contagem."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._failures = 0
+
+    @property
+    def is_open(self):
+        return self._failures >= self.threshold
+
+    def on_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def on_failure(self):
+        """Registra uma falha e retorna True se foi ela que desligou a API."""
+        with self._lock:
+            self._failures += 1
+            return self._failures == self.threshold
+
+class QuotaExhaustedError(Exception):
+    """A API foi desligada pelo CircuitBreaker depois de erros de quota seguidos."""
+
+def parse_retry_after(value):
+    """Converte o cabeçalho `Retry-After` (em segundos) para float, se possível."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class DiskCache:
+    """Cache persistente (shelve) e seguro para uso entre threads. O arquivo só é aberto no primeiro uso.
+
+    Depois de close() o cache não reabre o arquivo: leituras não encontram nada e gravações são ignoradas.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._db = None
+        self._closed = False
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha1("|".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def _open(self):
+        if self._db is None and not self._closed:
+            self._db = shelve.open(self.filename)
+        return self._db
+
+    def get(self, key):
+        with self._lock:
+            db = self._open()
+            return db.get(key) if db is not None else None
+
+    def set(self, key, value):
+        with self._lock:
+            db = self._open()
+            if db is not None:
+                db[key] = value
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+search_cache = DiskCache(CACHE_FILENAME)
+cse_rate_controller = RateController()
+cse_circuit_breaker = CircuitBreaker(CSE_QUOTA_FAILURES_TO_STOP)
+gemini_rate_controller = RateController()
+_thread_local = threading.local()
+# Marcado quando o pool de processos quebra; a partir daí a árvore HTML é montada na própria thread
+_parse_pool_broken = threading.Event()
+
+def get_search_service():
+    """Retorna o cliente da API de busca da thread atual (o cliente do Google não é thread-safe)."""
+    if not hasattr(_thread_local, 'service'):
+        _thread_local.service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
+    return _thread_local.service
+
+def create_http_session():
+    """Cria uma sessão HTTP única, reaproveitando conexões (keep-alive) entre as requisições."""
+    session = requests.Session()
+    retries = Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": USER_AGENT})
+    return session
+
+def is_daily_quota_error(error):
+    """Indica se o erro 429 é o limite diário da API (que não adianta repetir) e não o limite por minuto."""
+    content = error.content.decode('utf-8', 'ignore') if isinstance(error.content, bytes) else str(error.content)
+    details = f"{getattr(error, 'reason', '')} {content}".lower()
+    return 'per day' in details or 'dailylimit' in details or 'daily limit' in details
+
+def record_cse_quota_failure():
+    if cse_circuit_breaker.on_failure():
+        logger.error("🛑 ERRO DE QUOTA: Muitas buscas seguidas recusadas pela API do Google. As próximas buscas desta execução serão puladas.")
+
+def cse_search(service, cse_id, query, image=False):
+    """
+    Faz uma busca no Google Custom Search, consultando antes o cache em disco.
+    Em caso de 429 por minuto ou 5xx, espera o controle de ritmo e tenta de novo, por no máximo
+    CSE_MAX_RETRIES vezes e CSE_MAX_RETRY_SECONDS segundos. O limite diário não é repetido.
+    Os demais erros (ou a última falha) são repassados para quem chamou; com as buscas
+    desligadas pelo CircuitBreaker, levanta QuotaExhaustedError sem chamar a API.
+    """
+    key = DiskCache.make_key(query, image)
+    result = search_cache.get(key)
+    if result is not None:
+        return result
+    if cse_circuit_breaker.is_open:
+        raise QuotaExhaustedError("Buscas no Google desligadas por erros de quota")
+
+    params = {'q': query, 'cx': cse_id, 'num': 1}
+    if image:
+        params['searchType'] = 'image'
+    deadline = time.monotonic() + CSE_MAX_RETRY_SECONDS
+    for attempt in range(CSE_MAX_RETRIES + 1):
+        cse_rate_controller.wait()
+        try:
+            response = service.cse().list(**params).execute()
+        except HttpError as e:
+            if e.resp.status != 429 and e.resp.status < 500:
+                raise
+            if e.resp.status == 429:
+                record_cse_quota_failure()
+                if is_daily_quota_error(e) or cse_circuit_breaker.is_open:
+                    raise
+            cse_rate_controller.on_error(parse_retry_after(e.resp.get('retry-after')))
+            if attempt == CSE_MAX_RETRIES or time.monotonic() + cse_rate_controller.delay > deadline:
+                raise
+        else:
+            cse_rate_controller.on_success()
+            cse_circuit_breaker.on_success()
+            break
+
+    result = {'items': response.get('items', [])[:1]}
+    search_cache.set(key, result)
+    return result
+
 def search_product_page_url(product_name, service, cse_id):
-    """Usa a busca do Google para achar a página de um produto."""
+    """Usa a busca do Google para achar a página de um produto. Retorna SEARCH_ERROR se a API falhar."""
     try:
-        result = service.cse().list(q=product_name, cx=cse_id, num=1).execute()
+        result = cse_search(service, cse_id, product_name)
         if 'items' in result and result['items']:
             url = result['items'][0]['link']
             return url
         return None
+    except QuotaExhaustedError:
+        return SEARCH_ERROR
     except HttpError as e:
         if e.resp.status == 429:
-            tqdm.write("  -> 🛑 ERRO DE QUOTA: O limite diário de buscas da API do Google foi excedido.")
+            logger.error("🛑 ERRO DE QUOTA: O limite de buscas da API do Google foi excedido.")
         else:
-            tqdm.write(f"  -> Erro na API de busca do Google: {e}")
-        return None
+            logger.warning(f"Erro na API de busca do Google: {e}")
+        return SEARCH_ERROR
     except Exception as e:
-        tqdm.write(f"  -> Ocorreu um erro inesperado na busca: {e}")
-        return None
+        logger.warning(f"Ocorreu um erro inesperado na busca: {e}")
+        return SEARCH_ERROR
 
 def search_google_images(product_name, service, cse_id):
     """Como último recurso, busca a imagem do produto diretamente no Google Imagens."""
-    tqdm.write("  -> Tentativa final: buscando no Google Imagens...")
+    logger.info("Tentativa final: buscando no Google Imagens...")
     try:
-        result = service.cse().list(
-            q=product_name,
-            cx=cse_id,
-            searchType='image',
-            num=1
-        ).execute()
+        result = cse_search(service, cse_id, product_name, image=True)
         if 'items' in result and result['items']:
             image_url = result['items'][0]['link']
-            tqdm.write(f"  -> Imagem encontrada via Google Imagens: {image_url}")
+            logger.info(f"Imagem encontrada via Google Imagens: {image_url}")
             return image_url
         return None
+    except QuotaExhaustedError:
+        return SEARCH_ERROR
     except Exception as e:
-        tqdm.write(f"  -> Erro ao buscar no Google Imagens: {e}")
-        return None
+        logger.warning(f"Erro ao buscar no Google Imagens: {e}")
+        return SEARCH_ERROR
 
 
-def extract_image_url(page_url, product_name, service, cse_id):
+def extract_image_url(page_url, product_name, service, cse_id, session, parse_pool):
     """
     Extrai a URL da imagem principal. Se falhar, busca no Google Imagens.
     """
-    if not page_url:
-        return search_google_images(product_name, service, cse_id)
+    if page_url:
+        key = DiskCache.make_key('page', page_url)
+        image_url = search_cache.get(key)
+        if image_url is None:
+            image_url = scrape_image_from_page(page_url, session, parse_pool)
+            if image_url:
+                search_cache.set(key, image_url)
+        if image_url:
+            return image_url
+
+    # --- Tentativa 4: Se a página não tiver imagem, busca no Google Imagens ---
+    return search_google_images(product_name, service, cse_id)
+
 
+def scrape_image_from_page(page_url, session, parse_pool):
+    """
+    Baixa a página do produto e procura a imagem principal no HTML. Retorna None se não achar.
+    Lê primeiro só o começo da página; o restante só é baixado se a imagem não estiver ali.
+    """
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        resp = requests.get(page_url, headers=headers, timeout=15)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, 'html.parser')
-
-        # --- Tentativa 1: Seletor específico (ex: Mercado Livre) ---
-        img_tag = soup.find('img', class_='ui-pdp-gallery__figure__image')
-        if img_tag and img_tag.get('data-zoom'):
-            return img_tag.get('data-zoom')
-
-        # --- Tentativa 2: Meta tag 'og:image' ---
-        og_tag = soup.find('meta', property='og:image')
-        if og_tag and og_tag.get('content'):
-            return og_tag.get('content')
-
-        # --- Tentativa 3: Análise abrangente de todas as tags <img> ---
-        all_imgs = soup.find_all('img')
-        candidate_urls = []
-        for img in all_imgs:
-            src = img.get('data-zoom') or img.get('data-src') or img.get('src')
-            if not src:
-                continue
-            
-            src = urljoin(page_url, src)
-            src_lower = src.lower()
-            if any(keyword in src_lower for keyword in ['logo', 'icon', 'avatar', 'spinner', '.svg', '.gif', 'base64']):
-                continue
-            
-            candidate_urls.append(src)
-
-        for url in candidate_urls:
-            if 'zoom' in url.lower() or 'large' in url.lower():
-                return url
-        
-        if candidate_urls:
-            return candidate_urls[0]
+        with session.get(page_url, stream=True, timeout=15) as resp:
+            resp.raise_for_status()
+            head = resp.raw.read(PAGE_HEAD_BYTES, decode_content=True)
+            image_url = extract_image_from_html(head, page_url, parse_pool)
+            if image_url is None:
+                rest = resp.raw.read(decode_content=True)
+                if rest:
+                    image_url = extract_image_from_html(head + rest, page_url, parse_pool)
+        return image_url
 
     except requests.exceptions.RequestException:
         # Silencioso para não poluir, a busca no Google Imagens será a próxima etapa
@@ -149,36 +420,94 @@ def extract_image_url(page_url, product_name, service, cse_id):
     except Exception:
         pass
 
-    # --- Tentativa 4: Se tudo acima falhar, busca no Google Imagens ---
-    return search_google_images(product_name, service, cse_id)
+    return None
 
 
-def download_image(image_url, sku):
+def extract_image_from_html(content, page_url, parse_pool):
+    """
+    Procura a URL da imagem principal nos bytes do HTML.
+    A busca por regex roda aqui mesmo; a montagem da árvore HTML vai para o pool de processos
+    (ou para a própria thread, se o pool tiver quebrado).
+    """
+    # --- Atalho: procura a og:image direto nos bytes, sem montar a árvore HTML ---
+    match = _OG_RE.search(content) or _OG_RE2.search(content)
+    if match:
+        return urljoin(page_url, html.unescape(match.group(1).decode('utf-8', 'ignore')))
+
+    if not _parse_pool_broken.is_set():
+        try:
+            return parse_pool.submit(extract_image_from_tree, content, page_url).result()
+        except BrokenProcessPool:
+            if not _parse_pool_broken.is_set():
+                _parse_pool_broken.set()
+                logger.warning("Um processo de leitura do HTML caiu; as páginas passam a ser lidas nas próprias threads.")
+    return extract_image_from_tree(content, page_url)
+
+
+def extract_image_from_tree(content, page_url):
+    """Monta a árvore HTML com lxml (que detecta o encoding pela <meta charset>) e procura a imagem principal."""
+    tree = lxml.html.fromstring(content)
+
+    # --- Tentativa 1: Seletor específico (ex: Mercado Livre) ---
+    zoom = tree.xpath('string(//img[contains(concat(" ", normalize-space(@class), " "), " ui-pdp-gallery__figure__image ")]/@data-zoom)')
+    if zoom:
+        return urljoin(page_url, zoom)
+
+    # --- Tentativa 2: Meta tag 'og:image' ---
+    og_image = tree.xpath('string(//meta[@property="og:image"]/@content)')
+    if og_image:
+        return urljoin(page_url, og_image)
+
+    # --- Tentativa 3: Análise abrangente de todas as tags <img>, em uma única passada ---
+    sources = (img.get('data-zoom') or img.get('data-src') or img.get('src') for img in tree.iter('img'))
+    candidate_urls = [url for url in (urljoin(page_url, src) for src in sources if src) if not _BLACKLIST_RE.search(url)]
+    if candidate_urls:
+        return next((url for url in candidate_urls if _ZOOM_RE.search(url)), candidate_urls[0])
+    return None
+
+
+def download_image(image_url, sku, session):
     """Baixa a imagem a partir de uma URL e salva com o SKU do produto."""
     if not image_url or "não encontrada" in image_url.lower() or "erro" in image_url.lower():
         return image_url
     try:
-        response = requests.get(image_url, stream=True, timeout=15)
-        response.raise_for_status()
-
-        path = urlparse(image_url).path
-        ext = os.path.splitext(path)[1] or '.jpg'
-        filename = f"{sku}{ext}"
-
-        os.makedirs(IMAGE_FOLDER, exist_ok=True)
-        filepath = os.path.join(IMAGE_FOLDER, filename)
-
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(8192):
-                f.write(chunk)
+        # Imagens já são comprimidas: pedir 'identity' evita o servidor comprimir tudo de novo com gzip
+        with session.get(image_url, stream=True, timeout=15, headers={'Accept-Encoding': 'identity'}) as response:
+            response.raise_for_status()
+
+            path = urlparse(image_url).path
+            ext = os.path.splitext(path)[1] or '.jpg'
+            filename = f"{sku}{ext}"
+            filepath = os.path.join(IMAGE_FOLDER, filename)
+
+            response.raw.decode_content = True
+            with open(filepath, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, length=IMAGE_CHUNK_BYTES)
         return filepath
     except Exception:
         return "Erro ao baixar imagem"
 
+def copy_image(source_path, sku):
+    """Reaproveita uma imagem já baixada, copiando-a com o SKU de outro produto de mesmo nome."""
+    ext = os.path.splitext(source_path)[1]
+    filepath = os.path.join(IMAGE_FOLDER, f"{sku}{ext}")
+    if filepath == source_path:
+        return filepath
+    try:
+        shutil.copyfile(source_path, filepath)
+        return filepath
+    except OSError:
+        return "Erro ao baixar imagem"
+
+@lru_cache(maxsize=1)
+def _model():
+    """Cria o modelo do Gemini uma única vez (genai.configure já foi chamado em main())."""
+    return genai.GenerativeModel('gemini-1.5-flash')
+
 def generate_ai_descriptions(product_name):
     """Pede para a IA do Gemini criar uma descrição curta e uma longa (HTML)."""
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        model = _model()
         prompt = f"""
         Para o produto '{product_name}', crie duas descrições de venda distintas:
 
@@ -188,33 +517,174 @@ def generate_ai_descriptions(product_name):
         [DESCRIÇÃO LONGA HTML]
         (Escreva aqui uma descrição completa para e-commerce, formatada em HTML. Use parágrafos `<p>`, listas `<ul><li>...</li></ul>` e negrito `<strong>` para destacar características importantes. Não inclua as tags `<html>` ou `<body>`, apenas o conteúdo HTML interno que iria dentro de uma div de produto.)
         """
+        gemini_rate_controller.wait()
         response = model.generate_content(prompt)
+        gemini_rate_controller.on_success()
         text = response.text.strip()
 
-        short_desc_marker = "[DESCRIÇÃO CURTA]"
-        long_desc_marker = "[DESCRIÇÃO LONGA HTML]"
-
         short_desc = "Erro ao extrair descrição curta"
         long_desc_html = "<p>Erro ao extrair descrição longa.</p>"
 
-        if short_desc_marker in text and long_desc_marker in text:
-            start_short = text.find(short_desc_marker) + len(short_desc_marker)
-            end_short = text.find(long_desc_marker)
-            short_desc = text[start_short:end_short].strip()
-
-            start_long = text.find(long_desc_marker) + len(long_desc_marker)
-            long_desc_html = text[start_long:].strip()
+        match = _DESC_RE.search(text)
+        if match:
+            short_desc, long_desc_html = match.group(1).strip(), match.group(2).strip()
 
         return {"short": short_desc, "long_html": long_desc_html}
     except Exception as e:
         if 'quota' in str(e).lower():
-             tqdm.write("  -> 🛑 ERRO DE QUOTA: O limite de requisições da API Gemini foi atingido.")
+             gemini_rate_controller.on_error()
+             logger.error("🛑 ERRO DE QUOTA: O limite de requisições da API Gemini foi atingido.")
         else:
-            tqdm.write(f"  -> Erro ao chamar a API do Gemini: {e}")
+            logger.warning(f"Erro ao chamar a API do Gemini: {e}")
         return {"short": "Erro ao gerar descrição", "long_html": "<p>Erro ao gerar descrição.</p>"}
 
+def generate_ai_descriptions_batch(product_names):
+    """
+    Pede ao Gemini as descrições de vários produtos em uma única chamada (resposta em JSON).
+    Se o JSON da resposta vier inválido, gera as descrições produto a produto; se a própria
+    chamada falhar (quota, por exemplo), devolve as mensagens de erro para todos do lote.
+    """
+    if len(product_names) == 1:
+        return [generate_ai_descriptions(product_names[0])]
+
+    products_list = "\n".join(f"{i}. {name}" for i, name in enumerate(product_names, start=1))
+    try:
+        model = _model()
+        prompt = f"""
+        Para cada produto da lista abaixo, crie duas descrições de venda distintas:
+        - "short": um resumo atraente e direto sobre o produto em 1 ou 2 linhas de texto puro.
+        - "long_html": uma descrição completa para e-commerce, formatada em HTML. Use parágrafos `<p>`, listas `<ul><li>...</li></ul>` e negrito `<strong>` para destacar características importantes. Não inclua as tags `<html>` ou `<body>`, apenas o conteúdo HTML interno que iria dentro de uma div de produto.
+
+        Responda apenas com um array JSON, com um objeto por produto, usando o número do produto em "id":
+        [{{"id": 1, "short": "...", "long_html": "..."}}]
+
+        Produtos:
+        {products_list}
+        """
+        gemini_rate_controller.wait()
+        response = model.generate_content(prompt, generation_config={'response_mime_type': 'application/json'})
+        gemini_rate_controller.on_success()
+    except Exception as e:
+        if 'quota' in str(e).lower():
+            gemini_rate_controller.on_error()
+            logger.error("🛑 ERRO DE QUOTA: O limite de requisições da API Gemini foi atingido.")
+        else:
+            logger.warning(f"Erro ao chamar a API do Gemini: {e}")
+        return [{"short": "Erro ao gerar descrição", "long_html": "<p>Erro ao gerar descrição.</p>"} for _ in product_names]
+
+    try:
+        items = {int(item['id']): item for item in json.loads(response.text)}
+        return [
+            {"short": str(items[i]['short']).strip(), "long_html": str(items[i]['long_html']).strip()}
+            for i in range(1, len(product_names) + 1)
+        ]
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Resposta em lote do Gemini inválida ({e}). Gerando as descrições uma a uma...")
+        return [generate_ai_descriptions(name) for name in product_names]
+
+def batched(iterable, size):
+    """Divide um iterável em listas de até `size` itens."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
 # --- ROTINA PRINCIPAL ---
 
+def process_row(name, variants, session, parse_pool):
+    """
+    Busca página e imagem uma única vez para um nome de produto e monta a linha de saída de cada
+    SKU com esse nome (variações de cor, tamanho...), dado como tuplas (sku, quantidade, preço).
+    As descrições são geradas em lote e preenchidas depois, em main().
+    """
+    service = get_search_service()
+
+    logger.info(f"--- Processando: {name} ---")
+
+    product_page_url = search_product_page_url(name, service, CSE_ID)
+
+    if product_page_url == SEARCH_ERROR:
+        # A API de busca está falhando: nem tenta o Google Imagens, o produto será refeito depois
+        image_url = SEARCH_ERROR
+    else:
+        image_url = extract_image_url(product_page_url, name, service, CSE_ID, session, parse_pool)
+
+    if not image_url:
+        image_url = "Imagem não encontrada"
+        logger.warning(f"Nenhuma imagem encontrada para '{name}' mesmo após todas as tentativas.")
+
+    # Baixa a imagem uma vez e copia o arquivo para os demais SKUs
+    first_image_path = None
+    products = []
+    for sku, quantity, price in variants:
+        if first_image_path is None:
+            first_image_path = local_image_path = download_image(image_url, sku, session)
+        elif os.path.isfile(first_image_path):
+            local_image_path = copy_image(first_image_path, sku)
+        else:
+            local_image_path = first_image_path
+
+        products.append({
+            "Nome": name,
+            "Descrição Curta": None,
+            "Descrição Longa (HTML)": None,
+            "Preço": price,
+            "Referência / SKU": sku,
+            "Peso": 0,
+            "Estoque": quantity,
+            "URL da Imagem": image_url if "não encontrada" not in image_url else "Imagem+Nao+Encontrada",
+            "Situação": "Ativo",
+            "Caminho Imagem Local": local_image_path,
+            "URL Origem Página": product_page_url or "N/D",
+        })
+    return products
+
+def read_products_csv(input_path):
+    """Lê o CSV de entrada pelo leitor em C do pandas (bem mais rápido que o em Python) e mantém só as colunas usadas."""
+    # Sem 'usecols': com ele, linhas com colunas a mais deixam de ser descartadas e os valores saem deslocados
+    options = {
+        'sep': ';',
+        'on_bad_lines': 'skip',
+        'encoding': 'utf-8',
+        'dtype': {COL_SKU: str, COL_NAME: str},
+    }
+    try:
+        df = pd.read_csv(input_path, engine='c', **options)
+    except (pd.errors.ParserError, ValueError):
+        # Arquivos com formatação estranha que o leitor em C não aceita
+        df = pd.read_csv(input_path, engine='python', **options)
+    return df[[column for column in (COL_SKU, COL_NAME, COL_QTY, COL_PRICE) if column in df.columns]]
+
+def load_partial_results():
+    """Lê os produtos já concluídos em uma execução anterior que não chegou ao fim."""
+    if not os.path.exists(PARTIAL_FILENAME):
+        return []
+    try:
+        partial_df = pd.read_csv(PARTIAL_FILENAME, sep=';', encoding='utf-8', dtype={"Referência / SKU": str}, keep_default_na=False)
+        return partial_df.to_dict('records')
+    except Exception as e:
+        # Tira o arquivo do caminho; senão a nova execução continuaria gravando nele, sem cabeçalho,
+        # e toda retomada seguinte falharia do mesmo jeito
+        invalid_filename = PARTIAL_FILENAME + '.invalido'
+        os.replace(PARTIAL_FILENAME, invalid_filename)
+        print(f"⚠️ Não consegui ler o progresso salvo em '{PARTIAL_FILENAME}' (movido para '{invalid_filename}'), começando do zero. Detalhes: {e}")
+        return []
+
+def is_complete(product):
+    """Indica se a linha saiu sem nenhum valor de erro (ver ERROR_VALUES)."""
+    return not any(product[column] in ERROR_VALUES for column in ("Descrição Curta", "URL da Imagem", "Caminho Imagem Local", "URL Origem Página"))
+
+def excel_row(product):
+    """Monta a linha da planilha de saída na ordem de OUTPUT_COLUMNS (células vazias no lugar de NaN)."""
+    return [None if pd.isna(product[column]) else product[column] for column in OUTPUT_COLUMNS]
+
+def create_parse_pool():
+    """
+    Cria o pool de processos que monta as árvores HTML. Usa 'forkserver' (ou 'spawn', no Windows)
+    em vez de 'fork', que copiaria o processo com várias threads no meio do trabalho.
+    """
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context(start_method))
+
 def main():
     """Orquestra todo o processo, desde a leitura do arquivo até a gravação da saída."""
     if "COLE_SUA_CHAVE" in GOOGLE_API_KEY or "COLE_SEU_ID" in CSE_ID or "COLE_SUA_CHAVE" in GEMINI_API_KEY:
@@ -234,7 +704,7 @@ def main():
 
     try:
         if input_path.lower().endswith('.csv'):
-            df = pd.read_csv(input_path, sep=';', on_bad_lines='skip', encoding='utf-8', engine='python')
+            df = read_products_csv(input_path)
         elif input_path.lower().endswith(('.xls', '.xlsx')):
             df = pd.read_excel(input_path)
         else:
@@ -245,54 +715,112 @@ def main():
         return
 
     print(f"\n🚀 Começando! Encontrei {len(df)} produtos para processar.\n")
-    processed_products = []
-    service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
-
-    # Envolve o loop com tqdm para criar a barra de progresso
-    for index, row in tqdm(df.iterrows(), total=len(df), desc="Processando produtos"):
-        sku = row.get(COL_SKU, f'SKU_GEN_{index}')
-        name = row.get(COL_NAME, 'PRODUTO_SEM_NOME')
-        quantity = row.get(COL_QTY, 0)
-        price = row.get(COL_PRICE, 0.0)
-
-        # Atualiza a descrição da barra de progresso com o item atual
-        tqdm.write(f"\n--- Processando: {name} ---")
-
-        product_page_url = search_product_page_url(name, service, CSE_ID)
-        
-        image_url = extract_image_url(product_page_url, name, service, CSE_ID)
-        
-        if not image_url:
-            image_url = "Imagem não encontrada"
-            tqdm.write("  -> Nenhuma imagem encontrada mesmo após todas as tentativas.")
-
-        local_image_path = download_image(image_url, sku)
-        descriptions = generate_ai_descriptions(name)
-
-        processed_products.append({
-            "Nome": name,
-            "Descrição Curta": descriptions["short"],
-            "Descrição Longa (HTML)": descriptions["long_html"],
-            "Preço": price,
-            "Referência / SKU": sku,
-            "Peso": 0,
-            "Estoque": quantity,
-            "URL da Imagem": image_url if "não encontrada" not in image_url else "Imagem+Nao+Encontrada",
-            "Situação": "Ativo",
-            "Caminho Imagem Local": local_image_path,
-            "URL Origem Página": product_page_url or "N/D",
-        })
-        
-        time.sleep(1)
-
-    if processed_products:
-        output_df = pd.DataFrame(processed_products)
-        output_df.to_excel(OUTPUT_FILENAME, index=False)
-        print(f"\n🎉 Tudo pronto!")
-        print(f"Seu novo arquivo Excel foi salvo como '{OUTPUT_FILENAME}'")
-        print(f"As imagens foram baixadas para a pasta '{IMAGE_FOLDER}/'.")
-    else:
-        print("\n🤔 Nenhum produto foi processado.")
+    os.makedirs(IMAGE_FOLDER, exist_ok=True)
+
+    # Extrai as colunas uma única vez como listas simples, tratando aqui as colunas ausentes
+    skus = df[COL_SKU].astype(str).tolist() if COL_SKU in df.columns else [f'SKU_GEN_{index}' for index in df.index]
+    names = df[COL_NAME].astype(str).tolist() if COL_NAME in df.columns else ['PRODUTO_SEM_NOME'] * len(df)
+    quantities = df[COL_QTY].tolist() if COL_QTY in df.columns else [0] * len(df)
+    prices = df[COL_PRICE].tolist() if COL_PRICE in df.columns else [0.0] * len(df)
+    products = list(zip(skus, names, quantities, prices))
+
+    done_products = load_partial_results()
+    done_skus = {str(product["Referência / SKU"]) for product in done_products}
+    if done_products:
+        print(f"♻️ Retomando: {len(done_products)} produtos já processados anteriormente serão reaproveitados.\n")
+    products = [product for product in products if product[0] not in done_skus]
+
+    # Produtos com o mesmo nome (variações) são buscados e descritos uma única vez
+    variants_by_name = {}
+    for sku, name, quantity, price in products:
+        variants_by_name.setdefault(name, []).append((sku, quantity, price))
+    if len(variants_by_name) < len(products):
+        print(f"🔁 {len(products) - len(variants_by_name)} produtos repetem o nome de outro e vão reaproveitar a mesma busca e descrição.\n")
+
+    # Planilha em modo "write-only": as linhas vão direto para o arquivo, sem montar tudo na memória
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Produtos')
+    sheet.append(OUTPUT_COLUMNS)
+    for product in done_products:
+        sheet.append(excel_row(product))
+    total_products = len(done_products)
+
+    try:
+        # O pool só inicia seus processos no primeiro uso, com as threads já rodando; quem torna isso
+        # seguro é o método 'forkserver'/'spawn' escolhido em create_parse_pool(), não esta ordem
+        parse_pool = create_parse_pool()
+        log_listener = setup_logging()
+        session = create_http_session()
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        try:
+            with open(PARTIAL_FILENAME, 'a', newline='', encoding='utf-8') as partial_file, \
+                    tqdm(total=len(products), desc="Processando produtos") as progress:
+                writer = csv.DictWriter(partial_file, fieldnames=OUTPUT_COLUMNS, delimiter=';')
+                if partial_file.tell() == 0:
+                    writer.writeheader()
+
+                def submit_batch(batch_names):
+                    name_futures = []
+                    for name in batch_names:
+                        variants = variants_by_name[name]
+                        future = executor.submit(process_row, name, variants, session, parse_pool)
+                        future.add_done_callback(lambda _, count=len(variants): progress.update(count))
+                        name_futures.append(future)
+                    return name_futures, executor.submit(generate_ai_descriptions_batch, batch_names)
+
+                # Só alguns lotes ficam em andamento; um novo lote é enviado sempre que o mais antigo é gravado
+                pending_batches = batched(variants_by_name, AI_BATCH_SIZE)
+                in_flight = deque(submit_batch(batch_names) for batch_names in islice(pending_batches, BATCHES_IN_FLIGHT))
+
+                # Grava cada lote assim que ele termina, na ordem em que cada nome aparece na planilha
+                # (variações de um mesmo nome ficam juntas)
+                while in_flight:
+                    name_futures, description_future = in_flight.popleft()
+                    for future, desc in zip(name_futures, description_future.result()):
+                        for product in future.result():
+                            product["Descrição Curta"] = desc["short"]
+                            product["Descrição Longa (HTML)"] = desc["long_html"]
+                            sheet.append(excel_row(product))
+                            if is_complete(product):
+                                writer.writerow(product)
+                            total_products += 1
+                    partial_file.flush()
+
+                    next_batch = next(pending_batches, None)
+                    if next_batch:
+                        in_flight.append(submit_batch(next_batch))
+            executor.shutdown()
+        except KeyboardInterrupt:
+            # Cancela os lotes da fila, mas espera os que já estão rodando: eles ainda usam a sessão,
+            # o cache e o log, que são fechados logo abaixo
+            print("\n⏸️ Interrompido. Esperando os produtos em andamento terminarem...")
+            executor.shutdown(wait=True, cancel_futures=True)
+            print(f"O progresso foi salvo em '{PARTIAL_FILENAME}'; rode o script de novo para continuar.")
+            return
+        except BaseException:
+            # Não espera os lotes que ainda estão na fila antes de mostrar o erro, só os que já estão rodando
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            session.close()
+            parse_pool.shutdown(cancel_futures=True)
+            search_cache.close()
+            log_listener.stop()
+
+        if total_products:
+            workbook.save(OUTPUT_FILENAME)
+            os.remove(PARTIAL_FILENAME)
+            print(f"\n🎉 Tudo pronto!")
+            print(f"Seu novo arquivo Excel foi salvo como '{OUTPUT_FILENAME}'")
+            print(f"As imagens foram baixadas para a pasta '{IMAGE_FOLDER}/'.")
+        else:
+            os.remove(PARTIAL_FILENAME)
+            print("\n🤔 Nenhum produto foi processado.")
+    finally:
+        # Sem isso, uma planilha que não chegou a ser salva (Ctrl-C, erro, nenhum produto) deixa o
+        # gravador do openpyxl pela metade e gera avisos de LxmlSyntaxError ao fechar o script
+        if not sheet.closed:
+            sheet.close()
 
 
 if __name__ == "__main__":